@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Decoding speed of Online.net API payloads
+=========================================
+
+Decodes a synthetic payload of --servers server objects (10k by default,
+some with non-ASCII hostnames) with the former
+`json.loads(unicode(content.decode('raw_unicode_escape')))` path and with
+every installed online_net_api JSON backend, and reports the best time of
+--repeat runs of each.
+
+usage: decode.py [--servers SERVERS] [--repeat REPEAT]
+'''
+
+import argparse
+import json
+import os
+import sys
+from timeit import default_timer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'module_utils'))
+from online_net_api import available_json_backends, json_backend
+
+DATACENTERS = ['DC2', 'DC3', 'DC5']
+
+
+def payload(servers):
+    return json.dumps([{
+        'id': 100000 + i,
+        'hostname': (u'sd-%d' if i % 10 else u'sd-%d-\xe9t\xe9') % (100000 + i),
+        'offer': 'Dedibox XC 2016',
+        'power': 'ON',
+        'os': {'name': 'ubuntu', 'version': '14.04'},
+        'location': {'datacenter': DATACENTERS[i % len(DATACENTERS)], 'room': 's45', 'zone': 'Z1', 'rack': '%d' % (i % 40), 'position': i % 42},
+        'network': {'ip': ['10.%d.%d.%d' % (i >> 16 & 255, i >> 8 & 255, i & 255)], 'private': [], 'ipfo': []},
+        'disks': [{'$ref': '/api/v1/server/hardware/disk/%d' % (i * 2)}, {'$ref': '/api/v1/server/hardware/disk/%d' % (i * 2 + 1)}],
+        'contacts': {'owner': 'admin', 'tech': 'admin'},
+        'anti_ddos': False,
+        'hardware_watch': True,
+    } for i in range(servers)], ensure_ascii=False).encode('utf-8')
+
+
+def legacy_loads(content):
+    return json.loads(unicode(content.decode('raw_unicode_escape')))
+
+
+def best_of(loads, content, repeat):
+    best = None
+    for _ in range(repeat):
+        start = default_timer()
+        loads(content)
+        elapsed = default_timer() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the decoding speed of Online.net API payloads')
+    parser.add_argument('--servers', type=int, default=10000, help='Number of servers in the payload (default: 10000)')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of runs, the best one is kept (default: 5)')
+    args = parser.parse_args()
+
+    content = payload(args.servers)
+    print 'payload: %d servers, %.1f MiB' % (args.servers, len(content) / 1048576.0)
+
+    legacy = best_of(legacy_loads, content, args.repeat)
+    print '%-8s %8.1f ms' % ('legacy', legacy * 1000)
+    for name in available_json_backends():
+        loads = json_backend(name)[0]
+        elapsed = best_of(loads, content, args.repeat)
+        print '%-8s %8.1f ms  %5.2fx' % (name, elapsed * 1000, legacy / elapsed)
+
+    hostname = json_backend(available_json_backends()[0])[0](content)[0]['hostname']
+    print 'non-ASCII hostname: legacy %r, codec %r' % (legacy_loads(content)[0]['hostname'], hostname)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+
+'''
+Memory footprint of the inventory in-memory fleet representation
+=================================================================
+
+Builds a synthetic Online.net account of --servers servers (50k by default)
+and compares the deep size of the former representation (a list of server
+dicts, indices of lists of ints and the inventory) with the compact one
+(ServerRecords, array-backed indices and interned inventory).
+
+It then runs a whole refresh (fetching servers, building the indices and
+inventory, writing the cache) and a cached run loading it back, the former
+and the current way, each in its own process, and reports their peak
+resident memory and time.
+
+usage: fleet_memory.py [--servers SERVERS]
+'''
+
+import argparse
+import imp
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+from time import time
+
+INVENTORY = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'inventories', 'online_net', 'online_net.py')
+
+OS = [('ubuntu', '14.04'), ('debian', '8'), ('centos', '7'), ('proxmox', '4')]
+DATACENTERS = ['DC2', 'DC3', 'DC5']
+
+
+def server_json(i):
+    # One server as returned by `GET server/<id>`, each server is decoded on its own like the API responses
+    os_name, os_version = OS[i % len(OS)]
+    return json.dumps({
+        'id': 100000 + i,
+        'hostname': 'sd-%d' % (100000 + i),
+        'offer': 'Dedibox XC 2016',
+        'power': 'ON',
+        'boot_mode': 'normal',
+        'abuse': 'abuse@example.com',
+        'os': {'name': os_name, 'version': os_version},
+        'location': {'datacenter': DATACENTERS[i % len(DATACENTERS)], 'room': 's45', 'zone': 'Z1', 'line': 'B', 'column': 3, 'rack': '%d' % (i % 40), 'block': 'A', 'position': i % 42},
+        'network': {'ip': ['10.%d.%d.%d' % (i >> 16 & 255, i >> 8 & 255, i & 255)], 'private': ['10.90.%d.%d' % (i >> 8 & 255, i & 255)], 'ipfo': []},
+        'disks': [{'$ref': '/api/v1/server/hardware/disk/%d' % (i * 2)}, {'$ref': '/api/v1/server/hardware/disk/%d' % (i * 2 + 1)}],
+        'drive_arrays': [{'disks': [{'$ref': '/api/v1/server/hardware/disk/%d' % (i * 2)}], 'raid_level': 'RAID1'}],
+        'contacts': {'owner': 'admin', 'tech': 'admin'},
+        'rescue_credentials': {'login': None, 'password': None, 'protocol': None, 'ip': None},
+        'bmc': {'session_key': None},
+        'support': 'Basic service level',
+        'anti_ddos': False,
+        'hardware_watch': True,
+        'proactive_monitoring': False,
+    })
+
+
+def deep_size(obj, seen=None):
+    # Size of an object and of everything it references, each object being counted once
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            size += deep_size(k, seen) + deep_size(v, seen)
+    elif isinstance(obj, (list, tuple, set)):
+        for v in obj:
+            size += deep_size(v, seen)
+    elif hasattr(obj, '__dict__'):
+        size += deep_size(obj.__dict__, seen)
+    return size
+
+
+def legacy_structures(servers):
+    # The representation used before ServerRecords: plain dicts and lists everywhere
+    index = {'host_to_server': {}, 'id_to_server': {}, 'os_to_servers': {}, 'dc_to_servers': {}}
+    inventory = {}
+    for position, server in enumerate(servers):
+        index['host_to_server'].setdefault(str(server['network']['ip'][0]), []).append(position)
+        index['id_to_server'].setdefault(str(server['id']), []).append(position)
+        index['os_to_servers'].setdefault(str(server['os']['name']), []).append(position)
+        index['dc_to_servers'].setdefault(str(server['location']['datacenter']), []).append(position)
+
+        dest = server['network']['ip'][0]
+        inventory['id_' + str(server['id'])] = [dest]
+        inventory.setdefault(server['hostname'], []).append(dest)
+        inventory.setdefault('os_' + server['os']['name'], []).append(dest)
+        inventory.setdefault('dc_' + server['location']['datacenter'], []).append(dest)
+    return {'data': servers, 'index': index, 'inventory': inventory}
+
+
+def compact_structures(module, servers):
+    inventory = module.OnlineNetInventory.__new__(module.OnlineNetInventory)
+    inventory.data = module.ServerRecords(servers)
+    inventory.build_indices()
+    return {'data': inventory.data, 'index': inventory.index, 'inventory': inventory.inventory}
+
+
+def legacy_refresh(module, servers, cache_filename):
+    # The refresh as done before ServerRecords: full dicts, and all of them dumped at once to the cache
+    data = legacy_structures([json.loads(server_json(i)) for i in range(servers)])
+    cache = open(cache_filename, 'w')
+    cache.write(json.dumps(data, sort_keys=True, indent=2))
+    cache.close()
+
+
+def compact_refresh(module, servers, cache_filename):
+    inventory = module.OnlineNetInventory.__new__(module.OnlineNetInventory)
+    inventory.data = module.ServerRecords()
+    for i in range(servers):
+        inventory.data.append(json.loads(server_json(i)))
+    inventory.build_indices()
+    inventory.cache = module.FileCache(cache_filename, 0)
+    inventory.write_to_cache()
+
+
+def legacy_load(module, cache_filename):
+    # The cached run as done before ServerRecords: the whole cache decoded and used as is
+    cache = open(cache_filename, 'r')
+    json.loads(cache.read())
+    cache.close()
+
+
+def compact_load(module, cache_filename):
+    inventory = module.OnlineNetInventory.__new__(module.OnlineNetInventory)
+    inventory.data = module.ServerRecords()
+    inventory.cache = module.FileCache(cache_filename, 0)
+    inventory.load_from_cache()
+
+
+def measure(step, name, servers, cache_filename):
+    # Time, in seconds, and peak resident memory, in KiB, of a step run in a process of its own
+    output = subprocess.check_output([sys.executable, os.path.realpath(__file__), '--servers', str(servers), '--' + step, name, '--cache', cache_filename])
+    elapsed, peak = output.split()
+    return float(elapsed), int(peak)
+
+
+def report(title, legacy, compact):
+    print title
+    print 'legacy:  %10.1f MiB %8.2f s' % (legacy[1] / 1024.0, legacy[0])
+    print 'compact: %10.1f MiB %8.2f s' % (compact[1] / 1024.0, compact[0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the memory footprint of the inventory fleet representations')
+    parser.add_argument('--servers', type=int, default=50000, help='Number of synthetic servers (default: 50000)')
+    parser.add_argument('--refresh', choices=['legacy', 'compact'], help='Only run a refresh writing --cache, print its time and peak memory')
+    parser.add_argument('--load', choices=['legacy', 'compact'], help='Only load --cache, print its time and peak memory')
+    parser.add_argument('--cache', help='Cache file of --refresh and --load')
+    args = parser.parse_args()
+
+    module = imp.load_source('online_net_inventory', INVENTORY)
+
+    if args.refresh or args.load:
+        steps = {
+            'refresh': {'legacy': legacy_refresh, 'compact': compact_refresh},
+            'load': {'legacy': legacy_load, 'compact': compact_load},
+        }
+        start = time()
+        if args.refresh:
+            steps['refresh'][args.refresh](module, args.servers, args.cache)
+        else:
+            steps['load'][args.load](module, args.cache)
+        print time() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return
+
+    payloads = [server_json(i) for i in range(args.servers)]
+
+    legacy = deep_size(legacy_structures([json.loads(p) for p in payloads]))
+    compact = deep_size(compact_structures(module, (json.loads(p) for p in payloads)))
+    del payloads
+
+    print 'servers: %d' % args.servers
+    print 'steady state deep size'
+    print 'legacy:  %10.1f MiB' % (legacy / 1048576.0)
+    print 'compact: %10.1f MiB' % (compact / 1048576.0)
+    print 'ratio:   %10.2fx' % (float(legacy) / compact)
+
+    caches = {}
+    try:
+        for name in ('legacy', 'compact'):
+            fd, caches[name] = tempfile.mkstemp()
+            os.close(fd)
+        refresh = dict((name, measure('refresh', name, args.servers, caches[name])) for name in caches)
+        load = dict((name, measure('load', name, args.servers, caches[name])) for name in caches)
+    finally:
+        for cache_filename in caches.values():
+            os.remove(cache_filename)
+
+    report('refresh (peak RSS, time)', refresh['legacy'], refresh['compact'])
+    report('cached load (peak RSS, time)', load['legacy'], load['compact'])
+
+
+if __name__ == '__main__':
+    main()
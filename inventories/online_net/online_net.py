@@ -14,6 +14,28 @@ the cache is not used for current server information (in --list, --host, --all).
 This is so that accurate server information is always found.
 You can force this script to use the cache with --force-cache.
 
+----
+API calls go through a circuit breaker: a call failing with a transport
+error or a 5xx answer is retried until `circuit_max_failures` consecutive
+such errors, or calls slower than `circuit_max_latency` seconds, open the
+breaker. The remaining calls then fail fast instead of waiting for the
+`api_timeout`.
+When a refresh fails the last complete cache is served, even if expired,
+and flagged with the `online_net_cache_stale` variable. The cache is only
+ever replaced by a complete refresh. Servers deleted while refreshing
+(404) are left out.
+
+----
+The cache is a local file in `cache_path` by default. With
+`cache_backend=redis` it is kept in a Redis (or any Redis protocol) server
+given by `cache_redis_uri` instead, so that one refresh serves every
+controller using that server. Each refresh is stored as a new generation
+expiring after `cache_ttl` seconds, then published by swapping a single
+pointer key: readers see either the previous or the new generation whole.
+The previous generation then expires within a minute. A single controller
+refreshes at a time, holding a lock for at most `cache_lock_timeout`
+seconds, the others serve the current generation, stale if need be.
+
 ----
 Configuration is read from `online_net.ini`, then from environment variables,
 then and command-line arguments.
@@ -107,13 +129,11 @@ import os
 import sys
 import re
 import argparse
+import socket
+from array import array
+from itertools import chain
 from time import time
 
-try:
-    import json
-except ImportError:
-    import simplejson as json
-
 try:
     import httplib2
 except ImportError:
@@ -122,11 +142,335 @@ except ImportError:
 
 try:
     import six
-    from six.moves import configparser
+    from six.moves import configparser, http_client
+    from six.moves.urllib.parse import urlparse
 except ImportError, e:
     print "failed=True msg='`six` library required for this script'"
     sys.exit(1)
 
+# The JSON codec is shared with the online_net module, see module_utils/online_net_api.py
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', '..', 'module_utils'))
+try:
+    from online_net_api import ApiError, CircuitBreaker, CircuitOpenError, json_loads, json_dumps
+except ImportError:
+    print "failed=True msg='`online_net_api` from the module_utils directory required for this script'"
+    sys.exit(1)
+
+
+class FrozenMap(tuple):
+    # Immutable (key, value) pairs standing for a JSON object inside a ServerRecords
+
+    __slots__ = ()
+
+    # An object is never equal to an array holding the same pairs
+    def __eq__(self, other):
+        return type(other) is FrozenMap and tuple.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return tuple.__hash__(self)
+
+    def get(self, key, default=None):
+        for k, v in self:
+            if k == key:
+                return v
+        return default
+
+
+class ServerRecords(object):
+    # Memory-compact storage of the servers of an Online.net account
+    #
+    # Every server is kept as a tuple of values laid out after the shared `fields`
+    # tuple instead of a dict of its own. Strings are interned and nested objects
+    # and arrays are frozen and shared, so the OS, datacenter or offer blocks that
+    # thousands of servers have in common are only stored once.
+    # Servers are expanded back to plain dicts only when they are output.
+
+    MISSING = object()
+
+    def __init__(self, servers=()):
+        self.fields = ()   # Layout shared by all records
+        self.positions = {}  # Field name to its position in the layout
+        self.records = []  # One tuple of values per server
+        self.pool = {}     # Interned strings and frozen values
+
+        for server in servers:
+            self.append(server)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, position):
+        return self.expand(self.records[position])
+
+    def __iter__(self):
+        for record in self.records:
+            yield self.expand(record)
+
+    def append(self, server):
+        values = [self.MISSING] * len(self.fields)
+        for k, v in server.items():
+            k = self.intern(k)
+            if k not in self.positions:
+                self.positions[k] = len(self.fields)
+                self.fields += (k,)
+                values.append(self.MISSING)
+            values[self.positions[k]] = self.freeze(v)
+        self.records.append(tuple(values))
+
+    def get(self, position, field, default=None):
+        # Reads a single top level field of a server without expanding it
+        record = self.records[position]
+        i = self.positions.get(field)
+        if i is None or i >= len(record) or record[i] is self.MISSING:
+            return default
+        return record[i]
+
+    def intern(self, value):
+        return self.pool.setdefault(value, value)
+
+    def freeze(self, value):
+        return self.frozen(value)[0]
+
+    def frozen(self, value):
+        # Returns the frozen value and whether it only holds strings and nulls
+        #
+        # Only such values are shared: tuples compare True, 1 and 1.0 equal, so
+        # pooling values holding numbers or booleans would merge different ones.
+        # Objects are only sorted, so that equal ones match, when they are shared.
+        pool = self.pool
+        if isinstance(value, six.string_types):
+            return pool.setdefault(value, value), True
+        elif isinstance(value, dict):
+            shareable = True
+            items = []
+            for k, v in value.items():
+                v, item_shareable = self.frozen(v)
+                if not item_shareable:
+                    shareable = False
+                items.append((pool.setdefault(k, k), v))
+            if not shareable:
+                return FrozenMap(items), False
+            items.sort()
+            value = FrozenMap(items)
+        elif isinstance(value, list):
+            shareable = True
+            items = []
+            for v in value:
+                v, item_shareable = self.frozen(v)
+                if not item_shareable:
+                    shareable = False
+                items.append(v)
+            value = tuple(items)
+            if not shareable:
+                return value, False
+        else:
+            return value, value is None
+        return pool.setdefault(value, value), True
+
+    def expand(self, record):
+        server = {}
+        for i, v in enumerate(record):
+            if v is not self.MISSING:
+                server[self.fields[i]] = self.thaw(v)
+        return server
+
+    def thaw(self, value):
+        if isinstance(value, FrozenMap):
+            return dict((k, self.thaw(v)) for k, v in value)
+        elif isinstance(value, tuple):
+            return [self.thaw(v) for v in value]
+        return value
+
+
+class RedisError(Exception):
+    pass
+
+
+class FileCache(object):
+    # Cache backend keeping the cache in a local file
+
+    def __init__(self, filename, max_age):
+        self.filename = filename
+        self.max_age = max_age
+        self.location = filename
+
+    def is_valid(self):
+        # Determines if the cache file has expired, or if it is still valid
+        if os.path.isfile(self.filename):
+            mod_time = os.path.getmtime(self.filename)
+            current_time = time()
+            if (mod_time + self.max_age) > current_time:
+                return True
+        return False
+
+    def load(self):
+        # Returns the cached bytes, None if there is no cache
+        if not os.path.isfile(self.filename):
+            return None
+        cache = open(self.filename, 'rb')
+        data = cache.read()
+        cache.close()
+        return data
+
+    def lock(self):
+        # Refreshes are not coordinated, a local file isn't shared
+        return True
+
+    def unlock(self):
+        pass
+
+    def store(self, chunks):
+        # Written aside then renamed over, so that the cache is never left half written
+        tmp_filename = '%s.%d.tmp' % (self.filename, os.getpid())
+        cache = open(tmp_filename, 'wb')
+        for chunk in chunks:
+            cache.write(chunk)
+        cache.close()
+        os.rename(tmp_filename, self.filename)
+
+
+class RedisCache(object):
+    # Cache backend keeping the cache in a Redis protocol server shared by several controllers
+    #
+    # `<key>:<generation>` holds the cached bytes of a refresh, and `<key>` the
+    # name of the current generation, which is the time it was written at.
+    # Both expire after `ttl` seconds. A new generation is written first and then
+    # published by replacing `<key>`, in a transaction reading the generation it
+    # replaces. That one is then set to expire after `grace` seconds rather than
+    # deleted, other controllers may still be reading it.
+    # `<key>:lock` is held by the controller refreshing for at most `lock_timeout`
+    # seconds, the others keep serving the current generation meanwhile.
+
+    def __init__(self, uri, key, max_age, ttl, grace=60, lock_timeout=300, timeout=5):
+        uri = urlparse(uri)
+        self.host = uri.hostname or 'localhost'
+        self.port = uri.port or 6379
+        self.password = uri.password
+        self.db = uri.path.strip('/') or None
+        self.key = key
+        self.max_age = max_age
+        self.ttl = ttl
+        self.grace = grace
+        self.lock_timeout = lock_timeout
+        self.lock_id = None
+        self.timeout = timeout
+        self.location = 'redis://%s:%d/%s %s' % (self.host, self.port, self.db or 0, key)
+
+    def is_valid(self):
+        # The generation must be fresh and still there, it may have been evicted
+        try:
+            generation = self.command('GET', self.key)
+            if generation is None:
+                return False
+            if not self.command('EXISTS', '%s:%s' % (self.key, generation.decode('ascii'))):
+                return False
+        except (socket.error, RedisError):
+            return False
+        return float(generation) + self.max_age > time()
+
+    def load(self):
+        # Returns the cached bytes, None if there is no cache or the server can't be reached
+        try:
+            generation = self.command('GET', self.key)
+            if generation is None:
+                return None
+            return self.command('GET', '%s:%s' % (self.key, generation.decode('ascii')))
+        except (socket.error, RedisError), e:
+            sys.stderr.write('Unable to read cache %s (%s)\n' % (self.location, e))
+            return None
+
+    def lock(self):
+        # Takes the refresh lock, False when another controller holds it
+        self.lock_id = '%s:%d:%.6f' % (socket.gethostname(), os.getpid(), time())
+        try:
+            return self.command('SET', self.key + ':lock', self.lock_id, 'NX', 'EX', self.lock_timeout) is not None
+        except (socket.error, RedisError):
+            # Nothing to coordinate with, the refresh goes on and its store fails
+            return True
+
+    def unlock(self):
+        # Releases the refresh lock, unless it expired and another controller took it since
+        try:
+            if self.command('GET', self.key + ':lock') == self.lock_id.encode('ascii'):
+                self.command('DEL', self.key + ':lock')
+        except (socket.error, RedisError):
+            pass
+
+    def store(self, chunks):
+        try:
+            self.publish(self.write(chunks))
+        except (socket.error, RedisError), e:
+            sys.stderr.write('Unable to write cache %s (%s)\n' % (self.location, e))
+
+    def write(self, chunks):
+        # Writes a new generation and returns it
+        # The whole value has to be known to be sent, only the serialized bytes are gathered though
+        generation = '%.6f' % time()
+        self.command('SET', '%s:%s' % (self.key, generation), b''.join(chunks), 'EX', self.ttl)
+        return generation
+
+    def publish(self, generation):
+        # Swapped atomically, so that concurrent refreshes each expire the generation they replaced
+        previous = self.commands(
+            ('MULTI',),
+            ('GETSET', self.key, generation),
+            ('EXPIRE', self.key, self.ttl),
+            ('EXEC',),
+        )[-1][0]
+        if previous is not None and previous.decode('ascii') != generation:
+            self.command('EXPIRE', '%s:%s' % (self.key, previous.decode('ascii')), self.grace)
+
+    def command(self, *args):
+        # Runs a single command on a new connection and returns its reply
+        return self.commands(args)[0]
+
+    def commands(self, *commands):
+        # Runs commands one after the other on a new connection and returns their replies
+        connection = socket.create_connection((self.host, self.port), self.timeout)
+        try:
+            stream = connection.makefile('rb')
+            if self.password:
+                self.call(connection, stream, 'AUTH', self.password)
+            if self.db:
+                self.call(connection, stream, 'SELECT', self.db)
+            return [self.call(connection, stream, *args) for args in commands]
+        finally:
+            connection.close()
+
+    def call(self, connection, stream, *args):
+        request = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = six.text_type(arg).encode('utf-8')
+            request.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        connection.sendall(b''.join(request))
+        return self.reply(stream)
+
+    def reply(self, stream):
+        line = stream.readline()
+        if not line.endswith(b'\r\n'):
+            raise RedisError('connection closed')
+        kind, value = line[:1], line[1:-2]
+        if kind == b'+':
+            return value
+        elif kind == b'-':
+            raise RedisError(value.decode('utf-8', 'replace'))
+        elif kind == b':':
+            return int(value)
+        elif kind == b'$':
+            if int(value) < 0:
+                return None
+            data = stream.read(int(value) + 2)
+            return data[:-2]
+        elif kind == b'*':
+            if int(value) < 0:
+                return None
+            return [self.reply(stream) for _ in range(int(value))]
+        raise RedisError('unexpected reply %r' % line)
+
 
 class OnlineNetInventory(object):
 
@@ -138,15 +482,24 @@ class OnlineNetInventory(object):
         # Main execution path
 
         # OnlineNetInventory data
-        self.data = {}       # All Online.net data
+        self.data = ServerRecords()  # All Online.net data
         self.inventory = {}  # Ansible Inventory
         self.index = {}      # Various indices of servers metadata
+        self.stale = False   # Whether the data comes from an outdated cache the API failed to refresh
 
         # Define defaults
         self.api_uri = 'https://api.online.net/api/v1/'
         self.api_token = None
+        self.api_timeout = 30
+        self.circuit_max_failures = 3
+        self.circuit_max_latency = 10
         self.cache_path = '.'
         self.cache_max_age = 0
+        self.cache_backend = 'file'
+        self.cache_redis_uri = 'redis://localhost:6379/0'
+        self.cache_key = 'ansible-online_net'
+        self.cache_ttl = 86400
+        self.cache_lock_timeout = 300
 
         # Read settings, environment variables, and CLI arguments
         self.read_settings()
@@ -165,8 +518,17 @@ command line argument (--api-token), or environment variable (ONLINE_NET_API_TOK
             print 'ONLINE_NET_API_URI=%s ONLINE_NET_API_TOKEN=%s' % (self.api_uri, self.api_token)
             sys.exit(0)
 
+        self.breaker = CircuitBreaker(self.circuit_max_failures, self.circuit_max_latency)
+
         # Manage cache
-        self.cache_filename = self.cache_path + '/ansible-online_net.cache'
+        if self.cache_backend == 'redis':
+            self.cache = RedisCache(self.cache_redis_uri, self.cache_key, int(self.cache_max_age), self.cache_ttl,
+                                    lock_timeout=self.cache_lock_timeout)
+        elif self.cache_backend == 'file':
+            self.cache = FileCache(self.cache_path + '/ansible-online_net.cache', int(self.cache_max_age))
+        else:
+            print 'Unknown cache_backend %s, must be file or redis' % self.cache_backend
+            sys.exit(-1)
 
         if not self.args.force_cache and self.args.refresh_cache or not self.is_cache_valid():
             self.load_from_online_net()
@@ -186,19 +548,24 @@ command line argument (--api-token), or environment variable (ONLINE_NET_API_TOK
 
         # Pick the json_data to print based on the CLI command
         if self.args.all:
-            json_data = self.data
+            # Servers are written one at a time rather than expanding the whole fleet
+            for chunk in self.servers_json(self.args.pretty):
+                sys.stdout.write(chunk)
+            sys.stdout.write('\n')
+            return
 
         elif self.args.host:
             json_data = self.load_variables_for_host()
+            if self.stale:
+                json_data['online_net_cache_stale'] = True
 
         else:
             # '--list' this is last to make it default
             json_data = self.inventory
+            if self.stale:
+                json_data = dict(json_data, all={'vars': {'online_net_cache_stale': True}})
 
-        if self.args.pretty:
-            print json.dumps(json_data, sort_keys=True, indent=2)
-        else:
-            print json.dumps(json_data)
+        sys.stdout.write(json_dumps(json_data, self.args.pretty) + b'\n')
         ''' That's all she wrote...Goodnight, it's over with, that's all she wrote '''
 
     ###########################################################################
@@ -221,12 +588,28 @@ command line argument (--api-token), or environment variable (ONLINE_NET_API_TOK
 
         if config.has_option('online_net', 'api_token'):
             self.api_token = config.get('online_net', 'api_token')
+        if config.has_option('online_net', 'api_timeout'):
+            self.api_timeout = config.getint('online_net', 'api_timeout')
+        if config.has_option('online_net', 'circuit_max_failures'):
+            self.circuit_max_failures = config.getint('online_net', 'circuit_max_failures')
+        if config.has_option('online_net', 'circuit_max_latency'):
+            self.circuit_max_latency = config.getint('online_net', 'circuit_max_latency')
 
         # Cache related
         if config.has_option('online_net', 'cache_path'):
             self.cache_path = config.get('online_net', 'cache_path')
         if config.has_option('online_net', 'cache_max_age'):
             self.cache_max_age = config.getint('online_net', 'cache_max_age')
+        if config.has_option('online_net', 'cache_backend'):
+            self.cache_backend = config.get('online_net', 'cache_backend')
+        if config.has_option('online_net', 'cache_redis_uri'):
+            self.cache_redis_uri = config.get('online_net', 'cache_redis_uri')
+        if config.has_option('online_net', 'cache_key'):
+            self.cache_key = config.get('online_net', 'cache_key')
+        if config.has_option('online_net', 'cache_ttl'):
+            self.cache_ttl = config.getint('online_net', 'cache_ttl')
+        if config.has_option('online_net', 'cache_lock_timeout'):
+            self.cache_lock_timeout = config.getint('online_net', 'cache_lock_timeout')
 
     def read_environment(self):
         # Reads the settings from environment variables
@@ -278,14 +661,53 @@ command line argument (--api-token), or environment variable (ONLINE_NET_API_TOK
     def load_from_online_net(self):
         # Use Online.net API to get all the information from Online.net and save data in cache files
 
-        servers = []
-        servers_uris = self.api()
+        # Another controller is refreshing a shared cache, what it stores will serve this one too
+        if not self.cache.lock():
+            self.load_from_cache()
+            if len(self.data) > 0:
+                if not self.cache.is_valid():
+                    sys.stderr.write('Online.net cache %s being refreshed elsewhere, using stale cache\n' % self.cache.location)
+                    self.stale = True
+                return
+
+        try:
+            self.refresh()
+        finally:
+            self.cache.unlock()
+
+    def refresh(self):
+        # Nothing is replaced unless every server could be fetched, the last cache is served otherwise
+        try:
+            servers_uris = self.api()
+            if not isinstance(servers_uris, list):
+                raise ApiError('unexpected servers list')
+
+            # Servers are stored compactly as they come, the full dicts are not kept around
+            data = ServerRecords()
+            for server_uri in servers_uris:
+                try:
+                    server = self.api('server/' + server_uri.rsplit('/', 1)[1])
+                except ApiError, e:
+                    # Deleted since the servers list was fetched
+                    if e.status == 404:
+                        sys.stderr.write('Online.net server %s is gone, skipped\n' % server_uri)
+                        continue
+                    raise
+                if not isinstance(server, dict) or 'id' not in server or 'network' not in server:
+                    raise ApiError('unexpected data for %s' % server_uri)
+                data.append(server)
+        except ApiError, e:
+            self.load_stale_cache(e)
+            return
+
+        self.data = data
+        self.build_indices()
 
-        for server_uri in servers_uris:
-            servers.append(self.api('server/' + server_uri.rsplit('/', 1)[1]))
-        
-        self.data = servers
+        self.write_to_cache()
 
+    def build_indices(self):
+        # Build the indices and the Ansible inventory from the servers data
+        self.index = {}
         self.index['host_to_server'] = self.build_index(self.data, 'network.ip')
         self.index['id_to_server'] = self.build_index(self.data, 'id')
         self.index['os_to_servers'] = self.build_index(self.data, 'os.name')
@@ -293,40 +715,57 @@ command line argument (--api-token), or environment variable (ONLINE_NET_API_TOK
 
         self.build_inventory()
 
-        self.write_to_cache()
-
     def build_index(self, data, index_key):
+        # Postings are arrays of servers positions rather than lists of Python ints
         index = {}
 
-        for idx in enumerate(data):
+        for position in range(len(data)):
             if 'network.ip' == index_key:
-                key = idx[1]['network']['ip'][0]
+                key = data.get(position, 'network').get('ip')[0]
             elif 'id' == index_key:
-                key = idx[1]['id']
+                key = data.get(position, 'id')
             elif 'os.name' == index_key:
-                key = idx[1]['os']['name']
+                key = data.get(position, 'os').get('name')
             elif 'location.datacenter' == index_key:
-                key = idx[1]['location']['datacenter']
+                key = data.get(position, 'location').get('datacenter')
             else:
                 key = None
             if key is not None:
-                self.push(index, str(key), idx[0])
+                key = data.intern(str(key))
+                if key in index:
+                    index[key].append(position)
+                else:
+                    index[key] = array('l', [position])
 
         return index
 
     def build_inventory(self):
         # Build Ansible inventory of servers
         # Fist empty the inventory (could be set by cache) and then add all servers by id, hostname, os and datacenter
+        # Group names and addresses are interned so that each of them is only stored once
 
         self.inventory = {}
-
-        for server in self.data:
-            dest = server['network']['ip'][0]
-
-            self.inventory['id_' + str(server['id'])] = [dest]
-            self.push(self.inventory, server['hostname'], dest)
-            self.push(self.inventory, 'os_' + server['os']['name'], dest)
-            self.push(self.inventory, 'dc_' + server['location']['datacenter'], dest)
+        intern = self.data.intern
+
+        for position in range(len(self.data)):
+            dest = self.data.get(position, 'network').get('ip')[0]
+
+            self.inventory[intern('id_' + str(self.data.get(position, 'id')))] = [dest]
+            self.push(self.inventory, self.data.get(position, 'hostname'), dest)
+            self.push(self.inventory, intern('os_' + self.data.get(position, 'os').get('name')), dest)
+            self.push(self.inventory, intern('dc_' + self.data.get(position, 'location').get('datacenter')), dest)
+
+    def servers_json(self, pretty=False):
+        # Serializes the servers as a JSON array in chunks, expanding a single server at a time
+        yield b'['
+        separator = b'\n' if pretty else b''
+        for position in range(len(self.data)):
+            server = json_dumps(self.data[position], pretty)
+            if pretty:
+                server = b'\n'.join(b'  ' + line for line in server.split(b'\n'))
+            yield separator + server
+            separator = b',\n' if pretty else b','
+        yield b'\n]' if pretty and len(self.data) else b']'
 
     def load_variables_for_host(self):
         # Generate a JSON response to a --host call
@@ -355,33 +794,50 @@ command line argument (--api-token), or environment variable (ONLINE_NET_API_TOK
     ###########################################################################
 
     def is_cache_valid(self):
-        # Determines if the cache files have expired, or if it is still valid
-        if os.path.isfile(self.cache_filename):
-            mod_time = os.path.getmtime(self.cache_filename)
-            current_time = time()
-            if (mod_time + self.cache_max_age) > current_time:
-                return True
-        return False
+        # Determines if the cache has expired, or if it is still valid
+        return self.cache.is_valid()
+
+    def load_stale_cache(self, error):
+        # Falls back on the last complete cache, whatever its age, when the API failed to refresh it
+        self.load_from_cache()
+        if len(self.data) == 0:
+            print 'Online.net API unavailable (%s) and no cache to fall back on' % error
+            sys.exit(-1)
 
-    def load_from_cache(self):
-        # Reads the data from the cache file and assigns it to member variables as Python Objects
-        cache = open(self.cache_filename, 'r')
-        json_data = cache.read()
-        cache.close()
-        data = json.loads(json_data)
+        sys.stderr.write('Online.net API unavailable (%s), using stale cache %s\n' % (error, self.cache.location))
+        self.stale = True
 
-        self.data = data['data']
-        self.inventory = data['inventory']
-        self.index = data['index']
+    def load_from_cache(self):
+        # Reads the data from the cache and assigns it to member variables as Python Objects
+        json_data = self.cache.load()
+        if json_data is None:
+            return
+        data = json_loads(json_data)
+
+        if 'index' in data and 'inventory' in data:
+            # The decoded servers are served as they are: a cached run only outputs them,
+            # building the compact records would cost more CPU than the whole run
+            self.data = data['data']
+            self.index = data['index']
+            self.inventory = data['inventory']
+        else:
+            # Caches written without indices and inventory
+            self.data = ServerRecords(data['data'])
+            self.build_indices()
 
     def write_to_cache(self):
-        # Writes data in JSON format to a file
-        data = {'data': self.data, 'index': self.index, 'inventory': self.inventory}
-        json_data = json.dumps(data, sort_keys=True, indent=2)
-
-        cache = open(self.cache_filename, 'w')
-        cache.write(json_data)
-        cache.close()
+        # Writes data in JSON format to the cache, one server at a time
+        # Indices and inventory are stored as built, so that cached runs don't rebuild them
+        self.cache.store(chain([b'{"data":'], self.servers_json(), self.index_json(), [b',"inventory":', json_dumps(self.inventory), b'}']))
+
+    def index_json(self):
+        # Serializes the indices one at a time, postings as JSON arrays
+        yield b',"index":{'
+        separator = b''
+        for name, postings in self.index.items():
+            yield separator + json_dumps(name) + b':' + json_dumps(dict((k, list(v)) for k, v in postings.items()))
+            separator = b','
+        yield b'}'
 
     ###########################################################################
     # Utilities
@@ -414,21 +870,41 @@ command line argument (--api-token), or environment variable (ONLINE_NET_API_TOK
         return new_seq
 
     def api(self, command='server'):
+        # Calls the API through the circuit breaker, retrying transient failures until it opens
+        # Raises CircuitOpenError once it does, and ApiError right away for other errors
+        while True:
+            try:
+                return self.breaker.call(self.request, command)
+            except CircuitOpenError:
+                raise
+            except ApiError, e:
+                if not e.is_transient():
+                    raise
+                sys.stderr.write('Online.net API call failed (%s), retrying\n' % e)
+
+    def request(self, command):
         # Create a Http object and set some default options.
-        h = httplib2.Http(disable_ssl_certificate_validation=True, timeout=30)
+        h = httplib2.Http(disable_ssl_certificate_validation=True, timeout=self.api_timeout)
         headers = {
             'Content-Type': 'application/json',
             'Authorization': 'Bearer ' + self.api_token,
         }
-        resp, content = h.request(self.api_uri + command, headers=headers)
+        try:
+            resp, content = h.request(self.api_uri + command, headers=headers)
+        except (httplib2.HttpLib2Error, http_client.HTTPException, socket.error), e:
+            # Dropped connections surface as HTTPException, such as BadStatusLine or IncompleteRead
+            raise ApiError('%s: %s' % (command, e.__class__.__name__ if not str(e) else e))
         resp['status'] = int(resp['status'])
-        if resp['status'] == 200:
-            return json.loads(unicode(content.decode('raw_unicode_escape')))
-        else:
-            return {}
+        if resp['status'] != 200:
+            raise ApiError('%s: HTTP %d' % (command, resp['status']), resp['status'])
+        try:
+            return json_loads(content)
+        except ValueError, e:
+            raise ApiError('%s: %s' % (command, e))
 
 ###########################################################################
 # Run the script
 ###########################################################################
 
-OnlineNetInventory()
+if __name__ == '__main__':
+    OnlineNetInventory()
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+######################################################################
+# (c) 2015, Jean-Baptiste Guerraz <jbguerraz@gmail.com>,
+#           Andrey Postnikov <apostnikov@gmail.com>
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible.  If not, see <http://www.gnu.org/licenses/>.
+
+######################################################################
+# Online.net API helpers shared by the online_net inventory script and module
+#
+# The module imports it as `ansible.module_utils.online_net_api`, the
+# inventory script straight from this directory.
+######################################################################
+
+from time import time
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+
+######################################################################
+# Errors
+######################################################################
+
+class ApiError(Exception):
+    # The API could not be reached, or answered with an error or unusable data
+    #
+    # `status` is the HTTP status of the answer, None when there was no usable one.
+
+    def __init__(self, message, status=None):
+        Exception.__init__(self, message)
+        self.status = status
+
+    def is_transient(self):
+        # Whether the API itself failed, rather than turned down the request
+        return self.status is None or self.status >= 500
+
+
+class CircuitOpenError(ApiError):
+    # The call was not even attempted, the circuit breaker is open
+    pass
+
+
+######################################################################
+# Circuit breaker
+#
+# Calls go through CircuitBreaker.call(). After `max_failures` consecutive
+# failures the breaker opens and every call fails fast with
+# CircuitOpenError, instead of waiting for the API timeout, until
+# `reset_timeout` seconds have passed. Then a single trial call is let
+# through: it closes the breaker on success and opens it again on failure.
+# A call slower than `max_latency` seconds returns its result but counts
+# as a failure. Only transient errors are failures, an API answering 4xx
+# is up.
+######################################################################
+
+class CircuitBreaker(object):
+    def __init__(self, max_failures=3, max_latency=10, reset_timeout=60):
+        self.max_failures = max_failures
+        self.max_latency = max_latency
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+
+    def is_open(self):
+        return self.opened_at is not None and time() - self.opened_at < self.reset_timeout
+
+    def call(self, func, *args, **kwargs):
+        if self.is_open():
+            raise CircuitOpenError('circuit breaker open after %d consecutive failures' % self.failures)
+
+        start = time()
+        try:
+            result = func(*args, **kwargs)
+        except ApiError as e:
+            if e.is_transient():
+                self.failure()
+            else:
+                self.success()
+            raise
+
+        if self.max_latency and time() - start > self.max_latency:
+            self.failure()
+        else:
+            self.success()
+        return result
+
+    def success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def failure(self):
+        self.failures += 1
+        # A failed trial call opens the breaker again right away
+        if self.failures >= self.max_failures or self.opened_at is not None:
+            self.opened_at = time()
+
+
+######################################################################
+# JSON codec
+#
+# API responses and cache files are decoded from bytes straight into
+# objects (UTF-8, as served by the API) and encoded back to UTF-8 bytes.
+# ujson is used when installed, the standard library otherwise. Pretty
+# output, meant for people, always goes through the standard library.
+######################################################################
+
+BACKENDS = ('ujson', 'json')
+
+
+def _ujson():
+    import ujson
+
+    def dumps(obj, pretty=False):
+        # ujson indents empty objects and arrays over blank lines
+        if pretty:
+            return _json_dumps(obj, pretty)
+        data = ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False)
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+        return data
+
+    return ujson.loads, dumps
+
+
+def _json_dumps(obj, pretty=False):
+    if pretty:
+        data = json.dumps(obj, indent=2, sort_keys=True, separators=(',', ': '), ensure_ascii=False)
+    else:
+        data = json.dumps(obj, separators=(',', ':'), ensure_ascii=False)
+    if not isinstance(data, bytes):
+        data = data.encode('utf-8')
+    return data
+
+
+def _json():
+    return json.loads, _json_dumps
+
+
+def json_backend(name):
+    # Returns the (loads, dumps) pair of the named backend, ImportError if it isn't installed
+    return {'ujson': _ujson, 'json': _json}[name]()
+
+
+def available_json_backends():
+    # Names of the installed backends, fastest first
+    names = []
+    for name in BACKENDS:
+        try:
+            json_backend(name)
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+JSON_BACKEND = available_json_backends()[0]
+json_loads, json_dumps = json_backend(JSON_BACKEND)
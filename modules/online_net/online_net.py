@@ -61,6 +61,8 @@ options:
 
 notes:
   - Two environment variables can be used, ONLINE_NET_API_URI and ONLINE_NET_API_TOKEN.
+  - Desired hostname, RPN groups and BMC sessions are compared with the server fetched first, calls already satisfied are skipped.
+  - Supports check mode, the API calls that would be made are returned in C(planned_calls) instead of being made.
   - As of Ansible 2.0, Version 1 of the Online.net API is used.
 requirements:
   - "python >= 2.6"
@@ -96,6 +98,7 @@ try:
 except ImportError:
     has_http_lib = False
 
+import time
 from urllib import urlencode
 
 
@@ -105,6 +108,9 @@ class JsonfyMixIn(object):
 
 
 class Server(JsonfyMixIn):
+    check_mode = False
+    planned_calls = []
+
     def __init__(self, server_json):
         self.changed = False
         self.rescue_image = False
@@ -145,6 +151,8 @@ class Server(JsonfyMixIn):
             return False
 
     def name(self, name):
+        if self.hostname == name:
+            return False
         if self.api('server/' + str(self.id), dict(hostname=name), 'PUT'):
             self.hostname = name
             self.changed = True
@@ -154,33 +162,38 @@ class Server(JsonfyMixIn):
 
     def rpn_groups(self, join_groups):
         groups = self.api('rpn/group')
+        # Without the current groups nothing can be compared, nothing is written and the task fails
+        if groups is None:
+            raise Exception('Unable to list the RPN groups')
 
         groups_names_to_ids = {}
-        server_groups = []
+        server_groups = {}
 
         for group in groups:
             groups_names_to_ids[group['name']] = group['id']
             for member in group['members']:
                 if self.id == member['id']:
-                    server_groups.append(group['id'])
+                    server_groups[group['name']] = group['id']
                     break
 
-        for group_name in join_groups:
-            if group_name not in groups_names_to_ids:
-                self.api('rpn/group', dict(name=group_name, server_ids=self.id)) 
-
-        # heh. lazy sync !
+        # Only leave and join the groups that differ
         sync_success = True
-        for group_id in server_groups:
-            if not self.api('rpn/group/removeServers', dict(group_id=group_id, server_ids=self.id)):
-                sync_success = False
-        server_groups = []
+        for group_name, group_id in server_groups.items():
+            if group_name not in join_groups:
+                self.changed = True
+                if not self.api('rpn/group/removeServers', dict(group_id=group_id, server_ids=self.id)):
+                    sync_success = False
         for group_name in join_groups:
-            if not self.api('rpn/group/addServers', dict(group_id=groups_names_to_ids[group_name], server_ids=self.id)):
+            if group_name in server_groups:
+                continue
+            self.changed = True
+            if group_name not in groups_names_to_ids:
+                # The group is created with the server in it
+                if not self.api('rpn/group', dict(name=group_name, server_ids=self.id)):
+                    sync_success = False
+            elif not self.api('rpn/group/addServers', dict(group_id=groups_names_to_ids[group_name], server_ids=self.id)):
                 sync_success = False
-            else:
-                server_groups.append(dict(id=groups_names_to_ids[group_name], name=group_name))
-        self.groups = server_groups
+        self.groups = [dict(id=groups_names_to_ids.get(group_name), name=group_name) for group_name in join_groups]
 
         return sync_success
 
@@ -188,7 +201,18 @@ class Server(JsonfyMixIn):
         return self.api('server/rescue_images/' + str(self.id))
 
     def _bmc(self, ip):
+        # An already open BMC session is reused when it was authorized for that same ip
+        bmc = getattr(self, 'bmc', None) or {}
+        session_key = bmc.get('session_key')
+        if session_key and bmc.get('ip') in (None, ip):
+            authentication = self.api('server/bmc/session/' + str(session_key))
+            if authentication and authentication.get('ip', bmc.get('ip')) == ip:
+                authentication['session_key'] = session_key
+                return authentication
         session_key =  self.api('server/bmc/session', dict(server_id=self.id, ip=ip))
+        if session_key and self.check_mode:
+            self.changed = True
+            return True
         if session_key:
           authentication = False
           while not authentication:
@@ -204,8 +228,15 @@ class Server(JsonfyMixIn):
           return False
 
     def bmc_close(self, session_key):
-        self.bmc['session_key'] = None
-        return self.api('server/bmc/session/' + str(session_key), dict(bmc='close'), 'DELETE')
+        bmc = getattr(self, 'bmc', None) or {}
+        if 'session_key' in bmc and bmc['session_key'] != session_key:
+            return False
+        if self.api('server/bmc/session/' + str(session_key), dict(bmc='close'), 'DELETE'):
+            self.bmc = dict(bmc, session_key=None)
+            self.changed = True
+            return True
+        else:
+            return False
 
     @classmethod
     def find(cls, server_id=None):
@@ -218,12 +249,19 @@ class Server(JsonfyMixIn):
             return Server(server_json)
 
     @classmethod
-    def setup(cls, api_uri, api_token):
+    def setup(cls, api_uri, api_token, check_mode=False):
         cls.api_uri = api_uri
         cls.api_token = api_token
+        cls.check_mode = check_mode
+        cls.planned_calls = []
 
     @classmethod
     def api(cls, command='server', parameters=None, method='POST'):
+        # In check mode calls with parameters (writes) are only recorded
+        if parameters and cls.check_mode:
+            cls.planned_calls.append(dict(method=method, command=command, parameters=parameters))
+            return True
+
         # Create a Http object and set some default options.
         h = httplib2.Http(disable_ssl_certificate_validation=True, timeout=30)
 
@@ -240,7 +278,7 @@ class Server(JsonfyMixIn):
 
         resp['status'] = int(resp['status'])
         if resp['status'] in range(200,204):
-            return json.loads(unicode(content.decode('raw_unicode_escape')))
+            return json_loads(content)
         else:
             return None
 
@@ -263,7 +301,7 @@ def core(module):
     bmc_close = module.params['bmc_close']
 
     # First, try to find a server by id.
-    Server.setup(api_uri, api_token)
+    Server.setup(api_uri, api_token, module.check_mode)
     server = Server.find(server_id)
 
     # If we couldn't find the server, exit
@@ -293,7 +331,10 @@ def core(module):
         if state:
             output.append({'state': server.state(state)})
 
-        module.exit_json(changed=server.has_changed(), server=server.to_json(), output=json.dumps(output))
+        result = dict(changed=server.has_changed(), server=server.to_json(), output=json.dumps(output))
+        if module.check_mode:
+            result['planned_calls'] = Server.planned_calls
+        module.exit_json(**result)
 
 
 def main():
@@ -309,7 +350,8 @@ def main():
             rescue_images=dict(type='bool', default='no'),
             bmc=dict(type='str'),
             bmc_close=dict(type='str')
-        )
+        ),
+        supports_check_mode=True
     )
 
     if not has_http_lib:
@@ -322,6 +364,7 @@ def main():
 
 # import module snippets
 from ansible.module_utils.basic import *
+from ansible.module_utils.online_net_api import json_loads
 
 if __name__ == '__main__':
     main()
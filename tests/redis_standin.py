@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+
+'''
+Redis protocol stand-in server
+==============================
+
+A small in-memory server speaking the subset of the Redis protocol used by
+the inventory RedisCache backend: GET, SET (with EX), GETSET, EXPIRE, TTL,
+EXISTS, DEL, MULTI/EXEC, AUTH and SELECT. It is used by the tests, and can
+be run on its own to try `cache_backend=redis` without a Redis server:
+
+usage: redis_standin.py [--port PORT]
+'''
+
+import argparse
+import socket
+import threading
+from time import time
+
+try:
+    import SocketServer as socketserver
+except ImportError:
+    import socketserver
+
+
+class RedisStandinHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        queue = None  # Commands of a transaction once MULTI was received
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                break
+            args = []
+            for _ in range(int(line[1:-2])):
+                length = int(self.rfile.readline()[1:-2])
+                args.append(self.rfile.read(length + 2)[:-2])
+            command = args[0].upper().decode('ascii')
+            if command == 'MULTI':
+                queue = []
+                self.wfile.write(b'+OK\r\n')
+            elif command == 'EXEC':
+                self.wfile.write(self.server.execute_all(queue or []))
+                queue = None
+            elif queue is not None:
+                queue.append((command, args[1:]))
+                self.wfile.write(b'+QUEUED\r\n')
+            else:
+                self.wfile.write(self.server.execute(command, args[1:]))
+
+
+class RedisStandin(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0):
+        socketserver.TCPServer.__init__(self, (host, port), RedisStandinHandler)
+        self.data = {}  # key to (value, expiry time or None)
+        self.lock = threading.Lock()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        # Serves from a daemon thread, returns the server itself
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def get(self, key):
+        value, expiry = self.data.get(key, (None, None))
+        if expiry is not None and expiry <= time():
+            del self.data[key]
+            return None
+        return value
+
+    def ttl(self, key):
+        # Remaining seconds, -1 without expiry and -2 for a missing key
+        if self.get(key) is None:
+            return -2
+        expiry = self.data[key][1]
+        return -1 if expiry is None else int(round(expiry - time()))
+
+    def execute(self, command, args):
+        with self.lock:
+            return self.run(command, args)
+
+    def execute_all(self, commands):
+        # Runs the commands of a transaction with nothing in between, replies with an array
+        with self.lock:
+            replies = [self.run(command, args) for command, args in commands]
+        return b'*%d\r\n' % len(replies) + b''.join(replies)
+
+    def run(self, command, args):
+        if command in ('AUTH', 'SELECT'):
+            return b'+OK\r\n'
+        elif command == 'GETSET':
+            reply = self.run('GET', args[:1])
+            self.data[args[0]] = (args[1], None)
+            return reply
+        elif command == 'GET':
+            value = self.get(args[0])
+            if value is None:
+                return b'$-1\r\n'
+            return b'$%d\r\n%s\r\n' % (len(value), value)
+        elif command == 'SET':
+            expiry = None
+            options = [arg.upper() for arg in args[2:]]
+            if b'EX' in options:
+                expiry = time() + int(args[2 + options.index(b'EX') + 1])
+            if b'NX' in options and self.get(args[0]) is not None:
+                return b'$-1\r\n'
+            self.data[args[0]] = (args[1], expiry)
+            return b'+OK\r\n'
+        elif command == 'EXPIRE':
+            if self.get(args[0]) is None:
+                return b':0\r\n'
+            self.data[args[0]] = (self.data[args[0]][0], time() + int(args[1]))
+            return b':1\r\n'
+        elif command == 'TTL':
+            return b':%d\r\n' % self.ttl(args[0])
+        elif command == 'EXISTS':
+            return b':%d\r\n' % (self.get(args[0]) is not None)
+        elif command == 'DEL':
+            return b':%d\r\n' % (self.data.pop(args[0], None) is not None)
+        return b'-ERR unknown command ' + command.encode('ascii') + b'\r\n'
+
+
+def unused_port():
+    # A local port nothing listens on
+    s = socket.socket()
+    s.bind(('127.0.0.1', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run a Redis protocol stand-in server')
+    parser.add_argument('--port', type=int, default=6379, help='Port to listen on (default: 6379)')
+    args = parser.parse_args()
+    RedisStandin(port=args.port).serve_forever()
@@ -0,0 +1,99 @@
+# Tests of the CircuitBreaker shared by the inventory and the module
+#
+# Run with: python -m unittest discover tests
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'module_utils'))
+import online_net_api
+from online_net_api import ApiError, CircuitBreaker, CircuitOpenError
+
+
+class Clock(object):
+    # Stands in for time(), only moves when told to
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.time = online_net_api.time
+        online_net_api.time = self.clock
+        self.breaker = CircuitBreaker(max_failures=3, max_latency=10, reset_timeout=60)
+        self.calls = 0
+
+    def tearDown(self):
+        online_net_api.time = self.time
+
+    def succeed(self, duration=0):
+        self.calls += 1
+        self.clock.now += duration
+        return 'ok'
+
+    def fail(self, status=None):
+        self.calls += 1
+        raise ApiError('failed', status)
+
+    def trip(self):
+        for _ in range(3):
+            self.assertRaises(ApiError, self.breaker.call, self.fail)
+
+    def test_opens_after_max_failures(self):
+        self.assertRaises(ApiError, self.breaker.call, self.fail)
+        self.assertRaises(ApiError, self.breaker.call, self.fail)
+        self.assertFalse(self.breaker.is_open())
+        self.assertRaises(ApiError, self.breaker.call, self.fail)
+        self.assertTrue(self.breaker.is_open())
+
+        self.assertRaises(CircuitOpenError, self.breaker.call, self.succeed)
+        self.assertEqual(self.calls, 3)
+
+    def test_success_resets_failures(self):
+        self.assertRaises(ApiError, self.breaker.call, self.fail)
+        self.assertRaises(ApiError, self.breaker.call, self.fail)
+        self.assertEqual(self.breaker.call(self.succeed), 'ok')
+        self.assertRaises(ApiError, self.breaker.call, self.fail)
+        self.assertFalse(self.breaker.is_open())
+
+    def test_slow_call_is_a_failure(self):
+        for _ in range(3):
+            self.assertEqual(self.breaker.call(self.succeed, 11), 'ok')
+        self.assertTrue(self.breaker.is_open())
+
+    def test_call_under_max_latency(self):
+        for _ in range(3):
+            self.breaker.call(self.succeed, 9)
+        self.assertFalse(self.breaker.is_open())
+
+    def test_client_errors_are_not_failures(self):
+        for _ in range(3):
+            self.assertRaises(ApiError, self.breaker.call, self.fail, 404)
+        self.assertFalse(self.breaker.is_open())
+
+    def test_failed_trial_call_reopens(self):
+        self.trip()
+        self.clock.now += 61
+        self.assertFalse(self.breaker.is_open())
+
+        self.assertRaises(ApiError, self.breaker.call, self.fail)
+        self.assertTrue(self.breaker.is_open())
+        self.assertRaises(CircuitOpenError, self.breaker.call, self.succeed)
+
+    def test_successful_trial_call_closes(self):
+        self.trip()
+        self.clock.now += 61
+
+        self.assertEqual(self.breaker.call(self.succeed), 'ok')
+        self.assertFalse(self.breaker.is_open())
+        self.assertRaises(ApiError, self.breaker.call, self.fail)
+        self.assertFalse(self.breaker.is_open())
+
+
+if __name__ == '__main__':
+    unittest.main()
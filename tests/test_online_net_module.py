@@ -0,0 +1,156 @@
+# Tests of the online_net module Server no-op detection and check mode, Server.api is stubbed
+#
+# Run with: python -m unittest discover tests
+
+import imp
+import os
+import sys
+import types
+import unittest
+
+ROOT = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..')
+
+sys.path.insert(0, os.path.join(ROOT, 'module_utils'))
+import online_net_api
+
+try:
+    import ansible.module_utils.basic
+except ImportError:
+    # Server uses nothing from Ansible, empty stand-ins are enough to load the module
+    for name in ('ansible', 'ansible.module_utils', 'ansible.module_utils.basic'):
+        sys.modules[name] = types.ModuleType(name)
+sys.modules['ansible.module_utils.online_net_api'] = online_net_api
+
+module = imp.load_source('online_net_module', os.path.join(ROOT, 'modules', 'online_net', 'online_net.py'))
+Server = module.Server
+
+
+class ServerTest(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+        self.answers = {}
+        self.api = Server.__dict__['api']
+        Server.api = classmethod(self.stub_api)
+        Server.setup('https://api.online.net/api/v1/', 'token')
+
+    def tearDown(self):
+        Server.api = self.api
+
+    def stub_api(self, cls, command='server', parameters=None, method='POST'):
+        # Writes in check mode go to the real Server.api, they are planned there before any request
+        if parameters and cls.check_mode:
+            return self.api.__func__(cls, command, parameters, method)
+        self.calls.append((method if parameters else 'GET', command))
+        return self.answers.get(command, True)
+
+    def server(self, **server_json):
+        server_json.setdefault('id', 1337)
+        server_json.setdefault('hostname', 'sd-1337')
+        server_json.setdefault('power', 'ON')
+        return Server(server_json)
+
+    def rpn_groups(self, *groups):
+        self.answers['rpn/group'] = [
+            dict(id=group_id, name=name, members=[dict(id=1337)] if joined else [])
+            for group_id, name, joined in groups]
+
+    def test_name_unchanged(self):
+        server = self.server()
+        self.assertFalse(server.name('sd-1337'))
+        self.assertFalse(server.has_changed())
+        self.assertEqual(self.calls, [])
+
+    def test_name_changed(self):
+        server = self.server()
+        self.assertTrue(server.name('web-1'))
+        self.assertTrue(server.has_changed())
+        self.assertEqual(self.calls, [('PUT', 'server/1337')])
+
+    def test_rpn_groups_already_joined(self):
+        self.rpn_groups((1, 'A', True), (2, 'B', True), (3, 'C', False))
+        server = self.server()
+        self.assertTrue(server.rpn_groups(['A', 'B']))
+        self.assertFalse(server.has_changed())
+        self.assertEqual(self.calls, [('GET', 'rpn/group')])
+
+    def test_rpn_groups_differ(self):
+        self.rpn_groups((1, 'A', True), (2, 'B', False))
+        server = self.server()
+        self.assertTrue(server.rpn_groups(['B', 'C']))
+        self.assertTrue(server.has_changed())
+        self.assertEqual(sorted(self.calls), sorted([
+            ('GET', 'rpn/group'),
+            ('POST', 'rpn/group/removeServers'),
+            ('POST', 'rpn/group/addServers'),
+            ('POST', 'rpn/group'),
+        ]))
+
+    def test_rpn_groups_listing_failed(self):
+        self.answers['rpn/group'] = None
+        server = self.server()
+        self.assertRaises(Exception, server.rpn_groups, ['A'])
+        self.assertEqual(self.calls, [('GET', 'rpn/group')])
+
+    def test_bmc_session_reused(self):
+        self.answers['server/bmc/session/OLD'] = dict(ip='1.2.3.4', login='user')
+        server = self.server(bmc=dict(session_key='OLD'))
+        self.assertEqual(server._bmc('1.2.3.4'), dict(ip='1.2.3.4', login='user', session_key='OLD'))
+        self.assertFalse(server.has_changed())
+        self.assertEqual(self.calls, [('GET', 'server/bmc/session/OLD')])
+
+    def test_bmc_session_for_another_ip(self):
+        self.answers['server/bmc/session/OLD'] = dict(ip='9.9.9.9', login='user')
+        self.answers['server/bmc/session'] = 'NEW'
+        self.answers['server/bmc/session/NEW'] = dict(ip='1.2.3.4', login='other')
+        server = self.server(bmc=dict(session_key='OLD'))
+        self.assertEqual(server._bmc('1.2.3.4'), dict(ip='1.2.3.4', login='other', session_key='NEW'))
+        self.assertTrue(server.has_changed())
+        self.assertIn(('POST', 'server/bmc/session'), self.calls)
+
+    def test_bmc_close_without_session(self):
+        server = self.server(bmc=dict(session_key=None))
+        self.assertFalse(server.bmc_close('KEY'))
+        self.assertFalse(server.has_changed())
+        self.assertEqual(self.calls, [])
+
+    def test_bmc_close_failed(self):
+        self.answers['server/bmc/session/KEY'] = None
+        server = self.server(bmc=dict(session_key='KEY'))
+        self.assertFalse(server.bmc_close('KEY'))
+        self.assertFalse(server.has_changed())
+        self.assertEqual(server.bmc['session_key'], 'KEY')
+
+    def test_check_mode(self):
+        Server.setup('https://api.online.net/api/v1/', 'token', check_mode=True)
+        self.rpn_groups((1, 'A', True))
+        server = self.server()
+
+        self.assertFalse(server.name('sd-1337'))
+        self.assertTrue(server.name('web-1'))
+        self.assertTrue(server.rpn_groups(['A', 'B']))
+        self.assertTrue(server.state('off'))
+
+        self.assertTrue(server.has_changed())
+        # Only reads were made, writes were planned
+        self.assertEqual(self.calls, [('GET', 'rpn/group')])
+        self.assertEqual(Server.planned_calls, [
+            dict(method='PUT', command='server/1337', parameters=dict(hostname='web-1')),
+            dict(method='POST', command='rpn/group', parameters=dict(name='B', server_ids=1337)),
+            dict(method='POST', command='server/shutdown/1337', parameters=dict(reason='Shutted down by Ansible plugin')),
+        ])
+
+    def test_check_mode_unchanged(self):
+        Server.setup('https://api.online.net/api/v1/', 'token', check_mode=True)
+        self.rpn_groups((1, 'A', True))
+        server = self.server()
+
+        self.assertFalse(server.name('sd-1337'))
+        self.assertTrue(server.rpn_groups(['A']))
+        self.assertFalse(server.state('on'))
+
+        self.assertFalse(server.has_changed())
+        self.assertEqual(Server.planned_calls, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+# Tests of the inventory RedisCache backend against the Redis protocol stand-in
+#
+# Run with: python -m unittest discover tests
+
+import imp
+import os
+import unittest
+
+from redis_standin import RedisStandin, unused_port
+
+INVENTORY = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'inventories', 'online_net', 'online_net.py')
+inventory = imp.load_source('online_net_inventory', INVENTORY)
+
+
+class RedisCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.server = RedisStandin().start()
+        self.cache = self.redis_cache(self.server.port)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def redis_cache(self, port):
+        return inventory.RedisCache('redis://:secret@127.0.0.1:%d/1' % port, 'inv', max_age=3600, ttl=600, grace=30, timeout=1)
+
+    def test_empty(self):
+        self.assertFalse(self.cache.is_valid())
+        self.assertEqual(self.cache.load(), None)
+
+    def test_store_and_load(self):
+        self.cache.store([b'{"data":', b'[]', b'}'])
+        self.assertTrue(self.cache.is_valid())
+        self.assertEqual(self.cache.load(), b'{"data":[]}')
+
+        generation = self.server.get(b'inv')
+        self.assertEqual(self.server.ttl(b'inv'), 600)
+        self.assertEqual(self.server.ttl(b'inv:' + generation), 600)
+
+    def test_expired(self):
+        self.cache.max_age = 0
+        self.cache.store([b'{"data":[]}'])
+        self.assertFalse(self.cache.is_valid())
+        # Still served as a stale cache
+        self.assertEqual(self.cache.load(), b'{"data":[]}')
+
+    def test_evicted_generation(self):
+        self.cache.store([b'{"data":[]}'])
+        del self.server.data[b'inv:' + self.server.get(b'inv')]
+        self.assertFalse(self.cache.is_valid())
+        self.assertEqual(self.cache.load(), None)
+
+    def test_generation_swap(self):
+        self.cache.store([b'first'])
+        first = self.server.get(b'inv')
+        self.cache.store([b'second'])
+        second = self.server.get(b'inv')
+
+        self.assertNotEqual(first, second)
+        self.assertEqual(self.cache.load(), b'second')
+        self.assertEqual(self.server.ttl(b'inv:' + second), 600)
+        # The previous generation is still readable, for a short while only
+        self.assertEqual(self.server.get(b'inv:' + first), b'first')
+        self.assertEqual(self.server.ttl(b'inv:' + first), 30)
+
+    def test_superseded_generations_expire(self):
+        # Whichever controller stores, the generation it replaces is left to expire shortly
+        other = self.redis_cache(self.server.port)
+        for cache in (self.cache, other, self.cache, other):
+            cache.store([b'{"data":[]}'])
+        current = b'inv:' + self.server.get(b'inv')
+        generations = [key for key in self.server.data if key.startswith(b'inv:')]
+        self.assertEqual(len(generations), 4)
+        for key in generations:
+            self.assertEqual(self.server.ttl(key), 600 if key == current else 30)
+
+    def test_interleaved_stores(self):
+        # Two controllers refreshing at once, whichever publishes last is served
+        self.cache.store([b'first'])
+        first = self.server.get(b'inv')
+        other = self.redis_cache(self.server.port)
+        mine = self.cache.write([b'mine'])
+        theirs = other.write([b'theirs'])
+        other.publish(theirs)
+        self.cache.publish(mine)
+
+        self.assertEqual(self.cache.load(), b'mine')
+        self.assertEqual(self.server.ttl(b'inv:' + mine.encode('ascii')), 600)
+        self.assertEqual(self.server.ttl(b'inv:' + theirs.encode('ascii')), 30)
+        self.assertEqual(self.server.ttl(b'inv:' + first), 30)
+
+    def test_lock(self):
+        other = self.redis_cache(self.server.port)
+        self.assertTrue(self.cache.lock())
+        self.assertEqual(self.server.ttl(b'inv:lock'), 300)
+        self.assertFalse(other.lock())
+        # Only the holder releases it
+        other.unlock()
+        self.assertFalse(other.lock())
+        self.cache.unlock()
+        self.assertTrue(other.lock())
+
+    def test_expired_lock(self):
+        # A lock taken over once expired is not released by its former holder
+        other = self.redis_cache(self.server.port)
+        self.assertTrue(self.cache.lock())
+        del self.server.data[b'inv:lock']
+        self.assertTrue(other.lock())
+        self.cache.unlock()
+        self.assertFalse(self.cache.lock())
+
+    def test_refresh_elsewhere(self):
+        # A controller losing the refresh lock serves the current generation, without calling the API
+        self.cache.store([b'{"data":[{"id":1}],"index":{},"inventory":{"sd-1":["10.0.0.1"]}}'])
+        self.cache.max_age = 0
+        other = self.redis_cache(self.server.port)
+        self.assertTrue(other.lock())
+
+        loser = inventory.OnlineNetInventory.__new__(inventory.OnlineNetInventory)
+        loser.data = inventory.ServerRecords()
+        loser.stale = False
+        loser.cache = self.cache
+        loser.api = None
+        loser.load_from_online_net()
+        self.assertEqual(loser.inventory, {'sd-1': ['10.0.0.1']})
+        self.assertTrue(loser.stale)
+        self.assertEqual(self.server.get(b'inv:lock'), other.lock_id.encode('ascii'))
+
+    def test_unreachable(self):
+        cache = self.redis_cache(unused_port())
+        self.assertFalse(cache.is_valid())
+        self.assertEqual(cache.load(), None)
+        cache.store([b'{"data":[]}'])
+        # Refreshes go on when there is nothing to coordinate with
+        self.assertTrue(cache.lock())
+        cache.unlock()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+# Tests of the inventory ServerRecords compact storage
+#
+# Run with: python -m unittest discover tests
+
+import imp
+import os
+import unittest
+
+INVENTORY = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'inventories', 'online_net', 'online_net.py')
+inventory = imp.load_source('online_net_inventory', INVENTORY)
+
+
+def types(value):
+    # The value with every scalar replaced by its type, to compare what == doesn't tell apart
+    if isinstance(value, dict):
+        return dict((k, types(v)) for k, v in value.items())
+    elif isinstance(value, list):
+        return [types(v) for v in value]
+    return type(value)
+
+
+class ServerRecordsTest(unittest.TestCase):
+    def assertRoundTrip(self, servers):
+        records = inventory.ServerRecords(servers)
+        self.assertEqual(len(records), len(servers))
+        for position, server in enumerate(servers):
+            self.assertEqual(records[position], server)
+            self.assertEqual(types(records[position]), types(server))
+
+    def test_round_trip(self):
+        self.assertRoundTrip([
+            {'id': 1, 'hostname': u'sd-1', 'os': {'name': u'ubuntu', 'version': u'14.04'}, 'network': {'ip': [u'10.0.0.1'], 'ipfo': []}},
+            {'id': 2, 'hostname': u'sd-2-\xe9t\xe9', 'os': {'name': u'ubuntu', 'version': u'14.04'}, 'network': {'ip': [u'10.0.0.2'], 'ipfo': []}},
+        ])
+
+    def test_fields_differ(self):
+        self.assertRoundTrip([{'id': 1, 'a': u'x'}, {'id': 2, 'b': None}, {'a': u'x'}])
+
+    def test_booleans_and_numbers_kept_apart(self):
+        self.assertRoundTrip([
+            {'id': 1, 'flags': [1, 0], 'location': {'column': 1}},
+            {'id': 2, 'flags': [True, False], 'location': {'column': True}},
+            {'id': 3, 'flags': [1.0, 0], 'location': {'column': 1.0}},
+        ])
+
+    def test_objects_and_arrays_kept_apart(self):
+        self.assertRoundTrip([
+            {'id': 1, 'x': {'a': []}, 'y': [[u'a', []]], 'z': [{'a': []}], 'e': {}},
+            {'id': 2, 'x': [[u'a', []]], 'y': {'a': []}, 'z': [[[u'a', []]]], 'e': []},
+        ])
+
+    def test_shared_values(self):
+        records = inventory.ServerRecords([
+            {'id': 1, 'os': {'name': u'ubuntu', 'version': u'14.04'}},
+            {'id': 2, 'os': {'version': u'14.04', 'name': u'ubuntu'}},
+        ])
+        self.assertTrue(records.get(0, 'os') is records.get(1, 'os'))
+
+
+if __name__ == '__main__':
+    unittest.main()